@@ -24,99 +24,441 @@ Next time we run it again, it will try to do similar renaming only for files tha
 
 """
 
-import glob
+import atexit
+import collections
+import concurrent.futures
+import errno
+import itertools
 import logging
+import operator
 import os
 import sys
+import threading
 import traceback
 from datetime import datetime, timedelta
 
-# configure logging
+# max number of buffers one writev call accepts, sysconf returns -1 if unknown
+_IOV_MAX = os.sysconf("SC_IOV_MAX")
+if _IOV_MAX < 1:
+    _IOV_MAX = 1024
+
+
+# keeps formatted records in memory and writes them with os.writev when flushed
+class _BatchedWritevHandler(logging.StreamHandler):
+    def __init__(self, stream, capacity=4096, flush_level=logging.ERROR):
+        super().__init__(stream)
+
+        self.capacity = capacity
+        self.flush_level = flush_level
+
+        self._encoding = getattr(stream, "encoding", None) or "utf-8"
+        self._buffer = []
+
+    def emit(self, record):
+        try:
+            # surrogateescape writes undecodable filename bytes back as they were
+            self._buffer.append(
+                (self.format(record) + self.terminator).encode(
+                    self._encoding, "surrogateescape"
+                )
+            )
+        except Exception:
+            self.handleError(record)
+            return
+
+        if len(self._buffer) >= self.capacity or record.levelno >= self.flush_level:
+            self._write_buffer(record)
+
+    def flush(self):
+        self._write_buffer(
+            logging.makeLogRecord({"msg": "Writing buffered log records"})
+        )
+
+    def _write_buffer(self, record):
+        with self.lock:
+            if not self._buffer:
+                return
+
+            # records are removed from buffer only after they are written,
+            # so they are not lost if writing fails
+            try:
+                # anything printed earlier should be written before log records
+                self.stream.flush()
+
+                try:
+                    fd = self.stream.fileno()
+                except (AttributeError, OSError, ValueError):
+                    # stream without file descriptor, like io.StringIO
+                    self.stream.write(
+                        b"".join(self._buffer).decode(self._encoding, "surrogateescape")
+                    )
+                    self.stream.flush()
+
+                    self._buffer.clear()
+                    return
+
+                while self._buffer:
+                    written = os.writev(fd, self._buffer[:_IOV_MAX])
+
+                    # writev may write only part of data, keep what was not written
+                    index = 0
+
+                    while index < len(self._buffer) and written >= len(
+                        self._buffer[index]
+                    ):
+                        written -= len(self._buffer[index])
+                        index += 1
+
+                    if written:
+                        self._buffer[index] = self._buffer[index][written:]
+
+                    del self._buffer[:index]
+
+            except Exception:
+                self.handleError(record)
+
+
+# configure logging. records are kept in memory and written to stdout together,
+# instead of one write per line. errors are written immediately
 root = logging.getLogger()
-handler = logging.StreamHandler(sys.stdout)
+handler = _BatchedWritevHandler(sys.stdout, capacity=4096)
 handler.setFormatter(
     logging.Formatter(
         "%(asctime)s | %(name)s | %(funcName)s | %(levelname)s | %(message)s"
     )
 )
-
+atexit.register(handler.flush)
 
 root.addHandler(handler)
 
 logger = logging.getLogger("FILENAMES_SHORTENER")
 logger.setLevel(logging.DEBUG)
 
+_IS_LINUX = sys.platform.startswith("linux")
 
-def _get_shorter_name_filepath(long_name_filepath, max_allowed_filename_length):
-    parent_dir = os.path.dirname(long_name_filepath)
+# number of threads doing renames/links, capped to not run out of file descriptors
+MAX_WORKERS = min((os.cpu_count() or 1) * 4, 64)
 
-    long_name_filename = long_name_filepath.split("/")[-1]
+# max number of submitted files waiting to be logged, as files are streamed
+MAX_PENDING_FILES = MAX_WORKERS * 16
 
-    if "." in long_name_filename:
-        # file with extension case
-        name, extension = long_name_filename.rsplit(".", maxsplit=1)
+# max number of folders opened at once. waiting files keep their folder open,
+# so this is limited separately from MAX_PENDING_FILES
+MAX_OPEN_FOLDERS = MAX_WORKERS
 
-        max_allowed_filename_length = max_allowed_filename_length - len(extension) - 1
 
-        shorter_filename = f"{name[:max_allowed_filename_length]}.{extension}"
+def _get_shorter_filename(long_name_filename, max_allowed_filename_length):
+    # only called for names longer than max_allowed_filename_length,
+    # so returned name is always exactly max_allowed_filename_length long
+    dot_index = long_name_filename.rfind(".")
 
-        max_allowed_filename_length += len(extension) + 1
-    else:
-        shorter_filename = name[:max_allowed_filename_length]
+    # extension with dot, or empty string for files without extension
+    # or with extension too long to keep some part of name before it
+    extension = (
+        long_name_filename[dot_index:]
+        if dot_index > max(0, len(long_name_filename) - max_allowed_filename_length)
+        else ""
+    )
 
-    assert len(shorter_filename) == max_allowed_filename_length
+    name_length = max_allowed_filename_length - len(extension)
 
-    return os.path.join(parent_dir, shorter_filename)
+    return long_name_filename[:name_length] + extension
 
 
 def _process_long_name_having_file(
-    long_name_filepath,
+    parent_dir,
+    long_name_filename,
     max_allowed_filename_length,
+    dir_fd,
+    use_hardlink=False,
 ):
-    shorter_name_filepath = _get_shorter_name_filepath(
-        long_name_filepath, max_allowed_filename_length
+    shorter_name_filename = _get_shorter_filename(
+        long_name_filename, max_allowed_filename_length
     )
 
-    # rename long name-having file to short name-file
-    os.rename(long_name_filepath, shorter_name_filepath)
+    # names are relative to dir_fd (opened parent folder), so kernel
+    # does not need to resolve full parent path on every call
 
-    logger.info(f"Renamed {long_name_filepath} to {shorter_name_filepath}")
+    # steps done so far. they are logged also when later step fails,
+    # as they already changed files
+    steps = []
 
-    # create link with long filename that links to new shorter filename
-    # "Create a symbolic link pointing to src named dst.""
-    os.symlink(dst=long_name_filepath, src=shorter_name_filepath)
+    try:
+        # give short name to file while long name still exists, instead of
+        # renaming, so file always has at least one name, even if process is
+        # interrupted
+        try:
+            os.link(
+                long_name_filename,
+                shorter_name_filename,
+                src_dir_fd=dir_fd,
+                dst_dir_fd=dir_fd,
+            )
 
-    logger.info(
-        f"Created soft/symbolic link from {long_name_filepath} to {shorter_name_filepath}"
-    )
+            steps.append("hard_linked")
+
+        except FileExistsError:
+            # short name may be left by interrupted earlier run, continue only if
+            # it is same file. otherwise skip this file, to not lose other file
+            # that already has this name
+            if not os.path.samestat(
+                os.stat(long_name_filename, dir_fd=dir_fd, follow_symlinks=False),
+                os.stat(shorter_name_filename, dir_fd=dir_fd, follow_symlinks=False),
+            ):
+                return long_name_filename, shorter_name_filename, ["short_name_taken"]
+
+            steps.append("found_hard_link")
+
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM):
+                raise
+
+            # filesystem does not support hard links, rename long name-having file
+            # to short name-file instead
+            os.rename(
+                long_name_filename,
+                shorter_name_filename,
+                src_dir_fd=dir_fd,
+                dst_dir_fd=dir_fd,
+            )
+
+            steps.append("renamed")
 
+        if steps[0] != "renamed":
+            # file with both names is all we need in this case.
+            # nothing was changed if hard link was made by earlier run
+            if use_hardlink:
+                return long_name_filename, shorter_name_filename, steps
 
-def _get_last_modification_time_of_file(filepath):
+            # remove long name, to replace it with soft link below
+            os.unlink(long_name_filename, dir_fd=dir_fd)
 
-    return datetime.fromtimestamp(os.path.getmtime(filepath))
+            steps.append("removed_long_name")
 
+        # create link with long filename that links to new shorter filename
+        # "Create a symbolic link pointing to src named dst.""
+        os.symlink(
+            dst=long_name_filename,
+            src=f"{parent_dir}/{shorter_name_filename}",
+            dir_fd=dir_fd,
+        )
+
+        steps.append("soft_linked")
+
+    except Exception as e:
+        e.processed_file = long_name_filename, shorter_name_filename, steps
+        raise
+
+    return long_name_filename, shorter_name_filename, steps
+
+
+# what is logged for each step of processing a file
+_LOG_MESSAGES = {
+    "renamed": "Renamed %(dir)s/%(long)s to %(dir)s/%(short)s",
+    "hard_linked": "Created hard link %(dir)s/%(short)s to %(dir)s/%(long)s",
+    "found_hard_link": (
+        "Found hard link %(dir)s/%(short)s to %(dir)s/%(long)s from earlier run"
+    ),
+    "removed_long_name": (
+        "Removed %(dir)s/%(long)s, to replace it with soft/symbolic link"
+    ),
+    "soft_linked": (
+        "Created soft/symbolic link from %(dir)s/%(long)s to %(dir)s/%(short)s"
+    ),
+}
+
+
+# opened parent folder shared by workers, closed when last of them is done
+class _SharedFolderFd:
+    _open_folders_semaphore = threading.BoundedSemaphore(MAX_OPEN_FOLDERS)
+
+    def __init__(self, parent_dir):
+        # wait until workers close some folder, to not run out of file descriptors
+        self._open_folders_semaphore.acquire()
+
+        try:
+            self.fd = os.open(parent_dir, os.O_RDONLY | os.O_DIRECTORY)
+        except BaseException:
+            self._open_folders_semaphore.release()
+            raise
+
+        # submitting code holds 1 reference until all files of folder are submitted
+        self._users = 1
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+
+    def release(self, *_):
+        with self._lock:
+            self._users -= 1
+
+            if self._users:
+                return
+
+        os.close(self.fd)
+        self._open_folders_semaphore.release()
+
+
+def _log_processed_file(parent_dir, long_name_filename, shorter_name_filename, steps):
+    log_args = {
+        "dir": parent_dir,
+        "long": long_name_filename,
+        "short": shorter_name_filename,
+    }
+
+    # hard link made by earlier run and kept, nothing was changed
+    if not steps or steps == ["found_hard_link"]:
+        return False
+
+    if steps == ["short_name_taken"]:
+        logger.error(
+            "Skipped %(dir)s/%(long)s, as %(dir)s/%(short)s is another file",
+            log_args,
+        )
+        return False
+
+    for step in steps:
+        logger.info(_LOG_MESSAGES[step], log_args)
+
+    return True
+
+
+def _log_processed_future(parent_dir, future):
+    error = future.exception()
 
-def _get_files_to_process(folder_path, max_modification_datetime_to_allow):
-    files_to_process = []
+    if error is None:
+        return _log_processed_file(parent_dir, *future.result())
 
-    for i in glob.glob(f"{folder_path}/**/*", recursive=True):
-        if os.path.isfile(i):
+    # log steps done before failure, as log is the only record of what was changed
+    processed_file = getattr(error, "processed_file", None)
 
-            # skip links
-            if os.path.islink(i):
-                continue
+    if processed_file is not None:
+        _log_processed_file(parent_dir, *processed_file)
 
-            # skip newly modified files
-            if (
-                _get_last_modification_time_of_file(i)
-                <= max_modification_datetime_to_allow
+    raise error
+
+
+def _log_processed_files(pending, max_pending):
+    # log finished files in submission order, so log does not depend on threads
+    # timing. waits for oldest file while more than max_pending are submitted
+    logged_files_count = 0
+
+    while pending and (len(pending) > max_pending or pending[0][1].done()):
+        parent_dir, future = pending.popleft()
+
+        # stop on first failure, as before
+        logged_files_count += _log_processed_future(parent_dir, future)
+
+    return logged_files_count
+
+
+def _process_long_name_having_files(
+    files_to_process,
+    max_allowed_filename_length,
+    use_hardlink=False,
+):
+    processed_files_count = 0
+    pending = collections.deque()
+
+    # renames and links are syscalls that release GIL, so run them in threads.
+    # workers continue with next folders while earlier ones are still processed
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        try:
+            # open each parent folder once for all of its files
+            for parent_dir, parent_dir_files in itertools.groupby(
+                files_to_process, key=operator.itemgetter(0)
             ):
+                folder_fd = _SharedFolderFd(parent_dir)
+
+                try:
+                    for _, name in parent_dir_files:
+                        folder_fd.acquire()
+
+                        try:
+                            future = executor.submit(
+                                _process_long_name_having_file,
+                                parent_dir,
+                                name,
+                                max_allowed_filename_length,
+                                dir_fd=folder_fd.fd,
+                                use_hardlink=use_hardlink,
+                            )
+                        except BaseException:
+                            folder_fd.release()
+                            raise
+
+                        future.add_done_callback(folder_fd.release)
+                        pending.append((parent_dir, future))
+
+                        processed_files_count += _log_processed_files(
+                            pending, max_pending=MAX_PENDING_FILES
+                        )
+                finally:
+                    folder_fd.release()
+
+            processed_files_count += _log_processed_files(pending, max_pending=0)
+
+        finally:
+            # after failure, still log files that were processed,
+            # as log is the only record of what was changed
+            for parent_dir, future in pending:
+                try:
+                    _log_processed_future(parent_dir, future)
+                except Exception as e:
+                    # first failure is raised already, only log others
+                    logger.error("Failed processing file in %s: %s", parent_dir, e)
+
+    return processed_files_count
+
+
+# scandir gives file types from folder listing, without stat call per file
+def _iter_files(folder_path):
+    subfolder_paths = []
 
-                if len(i.split("/")[-1]) > max_allowed_filename_length:
+    try:
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                # skip hidden files and folders, same as glob did before
+                if entry.name.startswith("."):
+                    continue
+
+                # skip links
+                if entry.is_symlink():
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    subfolder_paths.append(entry.path)
+
+                elif entry.is_file(follow_symlinks=False):
+                    yield folder_path, entry.name, entry
+
+    # skip folders that can not be read, same as glob did before
+    except OSError as e:
+        logger.warning("Skipped folder %s, as it can not be read: %s", folder_path, e)
+
+    # subfolders after all files of this folder, so its files come together
+    # and its scandir is closed before going deeper
+    for subfolder_path in subfolder_paths:
+        yield from _iter_files(subfolder_path)
+
+
+def _iter_files_to_process(
+    folder_path, max_allowed_filename_length, max_modification_timestamp_to_allow
+):
+    for parent_dir, name, entry in _iter_files(folder_path):
+        # skip short names first, it does not need a stat call
+        if len(name) <= max_allowed_filename_length:
+            continue
 
-                    files_to_process.append(i)
+        # skip newly modified files
+        if (
+            entry.stat(follow_symlinks=False).st_mtime
+            <= max_modification_timestamp_to_allow
+        ):
 
-    return files_to_process
+            yield parent_dir, name
 
 
 def replace_longer_filenames_with_links_to_same_files_with_shorter_names(
@@ -124,43 +466,58 @@ def replace_longer_filenames_with_links_to_same_files_with_shorter_names(
     max_allowed_filename_length,
     ask_confirmation=True,
     earlier_than_now_minus_hours=False,
+    use_hardlink=False,
 ):
-    if not folder_path.endswith("/"):
-        folder_path = folder_path + "/"
+    # without trailing slash, as file paths are built as parent_dir/filename
+    folder_path = folder_path.rstrip("/") or "/"
 
     # useful checks
-    assert os.path.isdir(folder_path) and sys.platform.lower() == "linux"
+    assert _IS_LINUX and os.path.isdir(folder_path)
 
-    max_modification_datetime_to_allow = (
-        datetime.now() - timedelta(hours=earlier_than_now_minus_hours)
+    max_modification_timestamp_to_allow = (
+        (datetime.now() - timedelta(hours=earlier_than_now_minus_hours)).timestamp()
         if earlier_than_now_minus_hours
-        else datetime(9999, 1, 1)
+        else float("inf")
     )
 
-    # get list of files to process
-    files_to_process = _get_files_to_process(
+    # files are found while processing goes on, so they are not all kept in memory
+    files_to_process = _iter_files_to_process(
         folder_path,
-        max_modification_datetime_to_allow=max_modification_datetime_to_allow,
+        max_allowed_filename_length=max_allowed_filename_length,
+        max_modification_timestamp_to_allow=max_modification_timestamp_to_allow,
     )
 
-    # wait to see if numbers seem correct
-    print(f"Going to process {len(files_to_process)} files in {folder_path} ")
-
     if ask_confirmation:
+        # to show number of files we need to find all of them first
+        files_to_process = list(files_to_process)
+
+        # wait to see if numbers seem correct
+        print(f"Going to process {len(files_to_process)} files in {folder_path} ")
+
         # allow interrupt before starting
         if not input("Press y to continue\n").lower() == "y":
             print("Stopping as you have not pressed y to confirm")
             return
 
-    # replace with logging
-    logger.info(f"Started processing {len(files_to_process)} files")
+        # replace with logging
+        logger.info("Started processing %s files", len(files_to_process))
+    else:
+        logger.info("Started processing files in %s", folder_path)
+
+    try:
+        # do work
+        processed_files_count = _process_long_name_having_files(
+            files_to_process,
+            max_allowed_filename_length,
+            use_hardlink=use_hardlink,
+        )
 
-    # do work
-    for i in files_to_process:
-        _process_long_name_having_file(i, max_allowed_filename_length)
+        # Done
+        logger.info("Processing completed, processed %s files", processed_files_count)
 
-    # Done
-    logger.info(f"Processing completed")
+    finally:
+        # write buffered log records now, not only at exit, also after failure
+        handler.flush()
 
 
 # GO
@@ -185,13 +542,19 @@ if __name__ == "__main__":
         # your_python_binary_location this_filename.py your_folder_path earlier_than_now_minus_hours_number &>> log_filename_location
         ask_confirmation = 1
 
+        # set to True to create hard links instead of soft links, so opening long name
+        # does not need extra link resolution. Old file gets 2 names in that case.
+        # files hard-linked by earlier runs are found again, but left unchanged
+        use_hardlink = False
+
         replace_longer_filenames_with_links_to_same_files_with_shorter_names(
             folder_path=folder_path,
             max_allowed_filename_length=max_allowed_filename_length,
             ask_confirmation=ask_confirmation,
             earlier_than_now_minus_hours=int(earlier_than_now_minus_hours),
+            use_hardlink=use_hardlink,
         )
 
     except Exception as e:
         logging.error(e)
-        logging.error(f"Full traceback: {traceback.format_exc()}")
+        logging.error("Full traceback: %s", traceback.format_exc())
@@ -0,0 +1,44 @@
+import pytest
+
+from run_me import _get_shorter_filename
+
+MAX_LENGTH = 143
+
+
+@pytest.mark.parametrize(
+    "long_name_filename, shorter_filename",
+    [
+        # no extension
+        ("a" * 200, "a" * 143),
+        # multiple dots, only last extension is kept
+        ("a" * 200 + ".tar.gz", "a" * 140 + ".gz"),
+        ("a.b." * 50 + "txt", ("a.b." * 50)[:139] + ".txt"),
+        # leading dot is not an extension
+        ("." + "a" * 200, "." + "a" * 142),
+        # trailing dot is kept as empty extension
+        ("a" * 200 + ".", "a" * 142 + "."),
+        # longest extension that still keeps 1 character of name
+        ("a" * 10 + "." + "x" * 141, "a" + "." + "x" * 141),
+    ],
+)
+def test_get_shorter_filename(long_name_filename, shorter_filename):
+    assert _get_shorter_filename(long_name_filename, MAX_LENGTH) == shorter_filename
+
+
+@pytest.mark.parametrize("extension_length", [MAX_LENGTH - 1, MAX_LENGTH, 200])
+def test_get_shorter_filename_too_long_extension(extension_length):
+    # extension that does not leave space for name is cut as part of name
+    long_name_filename = "a" * 10 + "." + "x" * extension_length
+
+    assert (
+        _get_shorter_filename(long_name_filename, MAX_LENGTH)
+        == long_name_filename[:MAX_LENGTH]
+    )
+
+
+@pytest.mark.parametrize(
+    "long_name_filename",
+    ["a" * 144, "a" * 255, "a" * 200 + ".py", "." + "a" * 200, "a" * 10 + "." * 200],
+)
+def test_get_shorter_filename_length(long_name_filename):
+    assert len(_get_shorter_filename(long_name_filename, MAX_LENGTH)) == MAX_LENGTH
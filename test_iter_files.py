@@ -0,0 +1,32 @@
+import logging
+import os
+
+import run_me
+
+
+def test_unreadable_folder_is_skipped(tmp_path, monkeypatch, caplog):
+    long_name_filename = "a" * 200 + ".txt"
+
+    for folder_name in ("locked", "ok"):
+        (tmp_path / folder_name).mkdir()
+        (tmp_path / folder_name / long_name_filename).write_text(folder_name)
+
+    # chmod 000 does not stop root, so make scandir fail like for other users
+    scandir = os.scandir
+
+    def fake_scandir(path):
+        if os.path.basename(path) == "locked":
+            raise PermissionError(13, "Permission denied", path)
+
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", fake_scandir)
+
+    with caplog.at_level(logging.WARNING, logger="FILENAMES_SHORTENER"):
+        run_me.replace_longer_filenames_with_links_to_same_files_with_shorter_names(
+            str(tmp_path), 143, ask_confirmation=False
+        )
+
+    assert os.path.islink(tmp_path / "ok" / long_name_filename)
+    assert not os.path.islink(tmp_path / "locked" / long_name_filename)
+    assert f"Skipped folder {tmp_path / 'locked'}" in caplog.text
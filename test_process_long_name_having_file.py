@@ -0,0 +1,55 @@
+import errno
+import logging
+import os
+
+import pytest
+
+import run_me
+
+
+def _replace(tmp_path):
+    run_me.replace_longer_filenames_with_links_to_same_files_with_shorter_names(
+        str(tmp_path), 143, ask_confirmation=False
+    )
+
+
+def test_same_short_name_is_skipped(tmp_path, caplog):
+    # both names are shortened to "a" * 139 + ".txt"
+    first_filename = "a" * 200 + ".txt"
+    second_filename = "a" * 199 + "b.txt"
+
+    (tmp_path / first_filename).write_text("first")
+    (tmp_path / second_filename).write_text("second")
+    (tmp_path / "folder").mkdir()
+    (tmp_path / "folder" / ("b" * 200)).write_text("other")
+
+    with caplog.at_level(logging.INFO, logger="FILENAMES_SHORTENER"):
+        # second run should skip same file again, without failing
+        _replace(tmp_path)
+        _replace(tmp_path)
+
+    assert (tmp_path / first_filename).read_text() == "first"
+    assert (tmp_path / second_filename).read_text() == "second"
+    assert os.path.islink(tmp_path / "folder" / ("b" * 200))
+
+    skipped_records = [i for i in caplog.records if i.levelno == logging.ERROR]
+    assert len(skipped_records) == 2
+
+
+def test_done_steps_are_logged_when_later_step_fails(tmp_path, monkeypatch, caplog):
+    long_name_filename = "a" * 200 + ".txt"
+    (tmp_path / long_name_filename).write_text("content")
+
+    def failing_symlink(*args, **kwargs):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(os, "symlink", failing_symlink)
+
+    with caplog.at_level(logging.INFO, logger="FILENAMES_SHORTENER"):
+        with pytest.raises(OSError):
+            _replace(tmp_path)
+
+    # long name is already removed, so log is the only record of it
+    assert not (tmp_path / long_name_filename).exists()
+    assert f"Created hard link {tmp_path}/{'a' * 139}.txt" in caplog.text
+    assert f"Removed {tmp_path}/{long_name_filename}" in caplog.text